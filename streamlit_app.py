@@ -1,110 +1,151 @@
 import streamlit as st
 import pandas as pd
-import xml.etree.ElementTree as ET
-import re
-from io import StringIO
-import base64
+from lxml import etree as ET
+from io import BytesIO
+import csv
 import os
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 # Get the absolute path to the app directory
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
+IVR_DIR = os.path.join(APP_DIR, 'IVRs')
 
+# Parent elements under which a module's prompts are found
+PROMPT_PARENTS = {'promptData', 'announcements'}
+
+# Module children holding the IDs of connected modules
+CONNECTION_TAGS = {'ascendants', 'exceptionalDescendant', 'singleDescendant'}
+
+@st.cache_data(max_entries=4)
+def _read_campaign_data(csv_path, mtime):
+    """Read the campaign -> [IVR files] mapping as of the given modification time."""
+    campaign_ivrs = {}
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            campaign_ivrs.setdefault(row['Campaign'], []).append(row['IVR'])
+    return campaign_ivrs
+
+def load_campaign_data():
+    """Load the campaign-IVR associations as a campaign -> [IVR files] mapping, re-reading only when it changes."""
+    csv_path = os.path.join(APP_DIR, 'campaignivrs.csv')
+    return _read_campaign_data(csv_path, os.stat(csv_path).st_mtime)
+
+@st.cache_data(max_entries=16)
+def _list_dir(dir_path, mtime, suffix=''):
+    """List the entry names ending in suffix in a directory as of the given modification time."""
+    with os.scandir(dir_path) as entries:
+        return frozenset(entry.name for entry in entries if entry.name.endswith(suffix))
+
+def get_available_ivrs():
+    """List the IVR files in the IVRs directory, re-scanning only when it changes."""
+    return _list_dir(IVR_DIR, os.stat(IVR_DIR).st_mtime)
+
+def get_available_prompts():
+    """List the prompt WAV files in the app directory, re-scanning only when it changes."""
+    return _list_dir(APP_DIR, os.stat(APP_DIR).st_mtime, '.wav')
+
+@st.cache_data(max_entries=256)
+def _read_ivr_content(ivr_path, mtime):
+    """Read the raw XML bytes of an IVR file as of the given modification time."""
+    with open(ivr_path, 'rb') as f:
+        return f.read()
+
+def get_ivr_content(ivr_file):
+    """Read the raw XML bytes of an IVR file, re-reading only when it changes."""
+    ivr_path = os.path.join(IVR_DIR, ivr_file)
+    return _read_ivr_content(ivr_path, os.stat(ivr_path).st_mtime)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _read_prompt_audio(wav_path, mtime):
+    """Read the bytes of a prompt WAV file as of the given modification time."""
+    with open(wav_path, "rb") as f:
+        return f.read()
+
+def get_prompt_audio(wav_file):
+    """Read the bytes of a prompt WAV file, or None if it does not exist, re-reading only when it changes."""
+    wav_path = os.path.join(APP_DIR, wav_file)
+    try:
+        return _read_prompt_audio(wav_path, os.stat(wav_path).st_mtime)
+    except FileNotFoundError:
+        return None
+
+def fetch_many(wav_files, max_workers=8):
+    """Read prompt WAV files concurrently, keyed by filename."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(wav_files, executor.map(get_prompt_audio, wav_files)))
+
+@st.cache_data(max_entries=64)
 def extract_prompts(xml_content):
-    """Extract prompts from XML content."""
+    """Extract prompts from XML content as a DataFrame sorted by name."""
     root = ET.fromstring(xml_content)
-    prompts_list = []
     
     # First, find all announcement prompts and their enabled status
-    announcement_prompts = {}
-    for announcement in root.findall('.//announcements'):
+    announcement_enabled = {}
+    for announcement in root.iterfind('.//announcements'):
         enabled = announcement.find('enabled')
         prompt = announcement.find('prompt')
         if prompt is not None and enabled is not None:
             prompt_id = prompt.find('id')
             if prompt_id is not None:
-                announcement_prompts[prompt_id.text] = {
-                    'enabled': enabled.text.lower() == 'true'
-                }
+                announcement_enabled[prompt_id.text] = enabled.text.lower() == 'true'
     
     # Iterate through each module
-    for module in root.findall('.//modules/*'):
+    prompts_by_id = {}
+    for module in root.iterfind('.//modules/*'):
         module_name = module.find('moduleName')
+        if module_name is None:
+            continue
         
         # Check if module is disconnected
         is_disconnected = False
-        module_id = None
-        if module.find('moduleId') is not None:
-            module_id = module.find('moduleId').text
+        module_id = module.find('moduleId')
+        if module_id is not None:
             # If all connection IDs are the same as the module ID, it's disconnected
-            all_connections = []
-            for tag in ['ascendants', 'exceptionalDescendant', 'singleDescendant']:
-                connections = module.findall(f'./{tag}')
-                all_connections.extend([conn.text for conn in connections])
+            all_connections = [child.text for child in module if child.tag in CONNECTION_TAGS]
             
-            if all_connections and all(conn == module_id for conn in all_connections):
+            if all_connections and all(conn == module_id.text for conn in all_connections):
                 is_disconnected = True
         
-        if module_name is not None:
-            module_name = module_name.text
-            
-            # Find prompts in different possible locations
-            prompt_locations = [
-                './/filePrompt/promptData/prompt',
-                './/announcements/prompt',
-                './/prompt/filePrompt/promptData/prompt',
-                './/compoundPrompt/filePrompt/promptData/prompt',
-                './/promptData/prompt'
-            ]
-            
-            for location in prompt_locations:
-                for prompt_elem in module.findall(location):
-                    prompt_id = prompt_elem.find('id')
-                    prompt_name = prompt_elem.find('name')
-                    if prompt_id is not None and prompt_name is not None:
-                        # Check if this prompt has announcement settings
-                        enabled = announcement_prompts.get(prompt_id.text, {}).get('enabled', None)
-                        # If not an announcement prompt, mark as In Use/Not In Use
-                        if enabled is None:
-                            enabled = not is_disconnected
-                        
-                        # Get the wav filename from the prompt name
-                        wav_filename = f"{prompt_name.text}.wav"
-                        
-                        prompts_list.append({
-                            'ID': prompt_id.text,
-                            'Name': prompt_name.text,
-                            'Module': module_name,
-                            'Type': 'Announcement' if prompt_id.text in announcement_prompts else 'Play',
-                            'Enabled': enabled,
-                            'WavFile': wav_filename
-                        })
+        # Find the module's prompts in a single walk of its subtree
+        for prompt_elem in module.iter('prompt'):
+            if prompt_elem.getparent().tag not in PROMPT_PARENTS:
+                continue
+            prompt_id = prompt_elem.find('id')
+            prompt_name = prompt_elem.find('name')
+            if prompt_id is not None and prompt_name is not None:
+                # Keep one entry per prompt ID: the smallest name, then the first occurrence
+                existing = prompts_by_id.get(prompt_id.text)
+                if existing is None or prompt_name.text < existing[0]:
+                    prompts_by_id[prompt_id.text] = (prompt_name.text, module_name.text, is_disconnected)
     
-    # Sort by name and remove duplicates based on ID
-    unique_prompts = []
-    seen_ids = set()
-    for prompt in sorted(prompts_list, key=lambda x: x['Name']):
-        if prompt['ID'] not in seen_ids:
-            unique_prompts.append(prompt)
-            seen_ids.add(prompt['ID'])
-            
-    return unique_prompts
-
-def get_download_link(df, filename, text):
-    """Generate a download link for the dataframe."""
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}"> {text}</a>'
-    return href
-
-def get_audio_html(wav_path):
-    """Generate HTML for audio player if WAV file exists."""
-    if os.path.exists(wav_path):
-        with open(wav_path, "rb") as f:
-            audio_bytes = f.read()
-        audio_b64 = base64.b64encode(audio_bytes).decode()
-        return f'<audio controls><source src="data:audio/wav;base64,{audio_b64}" type="audio/wav">Your browser does not support the audio element.</audio>'
-    return " Audio file not found"
+    # Build the table column by column
+    ids, names, modules, types, enabled_col, wav_files = [], [], [], [], [], []
+    for prompt_id, (prompt_name, module_name, is_disconnected) in prompts_by_id.items():
+        # Check if this prompt has announcement settings
+        enabled = announcement_enabled.get(prompt_id)
+        # If not an announcement prompt, mark as In Use/Not In Use
+        if enabled is None:
+            enabled = not is_disconnected
+        
+        ids.append(prompt_id)
+        names.append(prompt_name)
+        modules.append(module_name)
+        types.append('Announcement' if prompt_id in announcement_enabled else 'Play')
+        enabled_col.append(enabled)
+        # Get the wav filename from the prompt name
+        wav_files.append(f"{prompt_name}.wav")
+    
+    df = pd.DataFrame({
+        'ID': ids,
+        'Name': names,
+        'Module': pd.Categorical(modules),
+        'Type': pd.Categorical(types),
+        'Enabled': enabled_col,
+        'WavFile': wav_files
+    })
+    
+    # Sort by name
+    return df.sort_values('Name', kind='stable', ignore_index=True)
 
 def main():
     st.set_page_config(page_title="Campaign Prompt Player", layout="wide")
@@ -115,17 +156,16 @@ def main():
     """)
 
     # Read campaign-IVR associations
-    campaign_df = pd.read_csv(os.path.join(APP_DIR, 'campaignivrs.csv'))
+    campaign_ivrs = load_campaign_data()
     
     # Get list of available IVR files
-    ivr_dir = os.path.join(APP_DIR, 'IVRs')
-    available_ivrs = set(os.listdir(ivr_dir))
+    available_ivrs = get_available_ivrs()
     
     # Filter campaigns to only those with available IVR files
     available_campaigns = []
-    for _, row in campaign_df.iterrows():
-        if row['IVR'] in available_ivrs:
-            available_campaigns.append(row['Campaign'])
+    for campaign, ivrs in campaign_ivrs.items():
+        if any(ivr in available_ivrs for ivr in ivrs):
+            available_campaigns.append(campaign)
     
     if not available_campaigns:
         st.error("No campaigns found with available IVR files.")
@@ -141,23 +181,19 @@ def main():
 
     if selected_campaign:
         # Get associated IVR file
-        ivr_file = campaign_df[campaign_df['Campaign'] == selected_campaign]['IVR'].iloc[0]
-        ivr_path = os.path.join(ivr_dir, ivr_file)
+        ivr_file = campaign_ivrs[selected_campaign][0]
+        ivr_path = os.path.join(IVR_DIR, ivr_file)
         
         try:
             # Read and process the IVR file
-            with open(ivr_path, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
+            xml_content = get_ivr_content(ivr_file)
             
-            prompts = extract_prompts(xml_content)
+            df = extract_prompts(xml_content)
             
-            if prompts:
-                # Convert to DataFrame
-                df = pd.DataFrame(prompts)
-                
+            if not df.empty:
                 # Display prompts
                 st.write(f"### Prompts in {ivr_file}")
-                st.write(f"Found {len(prompts)} prompts:")
+                st.write(f"Found {len(df)} prompts:")
                 
                 # Create columns for better layout
                 col1, col2 = st.columns([3, 1])
@@ -167,20 +203,28 @@ def main():
                     df['Status'] = df['Enabled'].map({True: '✅ Active', False: '❌ Not Active'})
                     
                     # Display the DataFrame with formatted columns
-                    display_df = df[['Name', 'Module', 'Type', 'Status']].copy()
-                    st.dataframe(display_df, use_container_width=True)
+                    st.dataframe(df[['Name', 'Module', 'Type', 'Status']], use_container_width=True)
                 
                 with col2:
-                    # Provide download link
-                    st.markdown(get_download_link(df, f"{ivr_file}_prompts.csv", "Download Prompts as CSV"), unsafe_allow_html=True)
+                    # Provide download button, writing the CSV straight to bytes
+                    csv_buffer = BytesIO()
+                    df.to_csv(csv_buffer, index=False)
+                    st.download_button(
+                        "Download Prompts as CSV",
+                        csv_buffer.getvalue(),
+                        f"{ivr_file}_prompts.csv",
+                        "text/csv"
+                    )
                 
                 # Display audio players for each prompt
                 st.write("### Play Prompts")
-                for _, prompt in df.iterrows():
-                    wav_path = os.path.join(APP_DIR, prompt['WavFile'])
-                    if os.path.exists(wav_path):
-                        st.write(f"**{prompt['Name']}** ({prompt['Status']})")
-                        st.markdown(get_audio_html(wav_path), unsafe_allow_html=True)
+                playable_df = df[df['WavFile'].isin(get_available_prompts())]
+                audio_by_file = fetch_many(list(playable_df['WavFile'].unique()))
+                for prompt in playable_df.itertuples(index=False):
+                    audio_bytes = audio_by_file[prompt.WavFile]
+                    if audio_bytes is not None:
+                        st.write(f"**{prompt.Name}** ({prompt.Status})")
+                        st.audio(audio_bytes, format='audio/wav')
                         st.divider()
                 
             else: